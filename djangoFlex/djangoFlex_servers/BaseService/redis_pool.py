@@ -0,0 +1,5 @@
+import redis
+from django.conf import settings
+
+# 所有 Redis 客戶端共用同一個連接池
+redis_pool = redis.ConnectionPool(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=settings.REDIS_DB, max_connections=64)
@@ -14,6 +14,7 @@ class VideoCapConfig(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     redis_host = models.CharField(max_length=255, default='localhost')
     redis_client = models.CharField(max_length=255, default='default')
+    stream_probe = models.JSONField(null=True, blank=True)  # ffprobe result: format_name, codec_name, width, height, pix_fmt
 
     def __str__(self):
         return f"VideoCapConfig: {self.name}, RTMP URL={self.rtmp_url}, Active={self.is_active}"
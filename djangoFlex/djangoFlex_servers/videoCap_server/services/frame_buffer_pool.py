@@ -0,0 +1,31 @@
+import queue
+import numpy as np
+
+class FrameBufferPool:
+    def __init__(self, shape, count, dtype=np.uint8):
+        """
+        初始化 FrameBufferPool 類。
+        預先分配 count 個固定形狀的幀緩衝區，並以 ID 管理空閒緩衝區。
+        """
+        self.shape = shape
+        self.buffers = [np.empty(shape, dtype=dtype) for _ in range(count)]
+        self.free_ids = queue.Queue()
+        for buffer_id in range(count):
+            self.free_ids.put(buffer_id)
+
+    def reserve_for_producer(self):
+        """
+        為生產者取出一個空閒緩衝區。
+        沒有空閒緩衝區時返回 (None, None)，由調用方決定丟幀。
+        """
+        try:
+            buffer_id = self.free_ids.get_nowait()
+        except queue.Empty:
+            return None, None
+        return buffer_id, self.buffers[buffer_id]
+
+    def relinquish(self, buffer_id):
+        """
+        消費者用完後歸還緩衝區。
+        """
+        self.free_ids.put(buffer_id)
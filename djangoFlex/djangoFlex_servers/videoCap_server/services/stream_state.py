@@ -0,0 +1,25 @@
+import asyncio
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Optional
+from ..models import VideoCapConfig
+from .frame_buffer_pool import FrameBufferPool
+
+@dataclass(slots=True)
+class StreamState:
+    """
+    單路視頻流的運行狀態。
+    配置、FFmpeg 進程、運行標記與捕獲任務集中在一條記錄中，捕獲協程只持有這一個引用。
+    """
+    rtmp_url: str
+    config: VideoCapConfig
+    running: bool = False
+    process: Optional[asyncio.subprocess.Process] = None
+    task: Optional[Future] = None
+    reconnect_attempts: int = 0
+    reconnect_start_time: Optional[float] = None
+    last_check_time: float = 0.0
+    frame_pool: Optional[FrameBufferPool] = None
+    ffmpeg_command: Optional[tuple] = None  # 預先構建好的 FFmpeg 命令，重連時直接復用
+    last_clip_path: Optional[str] = None  # 最近一次登記的 TS 文件，避免每次檢查都查詢數據庫
+    stop_event: asyncio.Event = field(default_factory=asyncio.Event)  # 停止時喚醒重連退避中的等待
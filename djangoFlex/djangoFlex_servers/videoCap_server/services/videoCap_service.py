@@ -1,11 +1,14 @@
-import cv2
+import numpy as np
 import time
 import threading
 from ..models import VideoCapConfig, CurrentVideoClip, CameraList
+from .frame_buffer_pool import FrameBufferPool
+from .stream_state import StreamState
+from ...BaseService.redis_pool import redis_pool
 from django.db import transaction
 from django.utils import timezone
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 import os
 from datetime import timedelta, datetime
 import subprocess
@@ -16,20 +19,30 @@ import re
 import logging
 import ssl
 import socket
+import queue
+import fcntl
+import redis
 from urllib.parse import urlparse
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+F_SETPIPE_SZ = getattr(fcntl, 'F_SETPIPE_SZ', 1031)
+
 class VideoCapService:
     def __init__(self):
         """
         初始化 VideoCapService 類。
         設置各種配置參數，創建必要的目錄，並加載配置。
         """
-        self.configs = {}
-        self.caps = {}
-        self.running = {}
-        self.capture_threads = {}
+        self.streams = {}  # rtmp_url -> StreamState
         self.max_reconnect_attempts = 5
-        self.reconnect_timeout = 5
+        # seconds, 只作保險，由 max_reconnect_attempts 決定何時放棄。最壞情況為指數退避 1+2+4+8+16 秒，
+        # 加上 5 次重連各自最多 rw_timeout 的重新探測與 FFmpeg 讀取超時（5 × (5 + 5) 秒），共約 81 秒，
+        # 即連續失敗約 31 至 81 秒後將流設為非活動
+        self.reconnect_timeout = 90
         self.executor = ThreadPoolExecutor(max_workers=10)
         self.fps = 15
         self.frame_interval = 1 / self.fps
@@ -39,9 +52,23 @@ class VideoCapService:
         self.resolution = (1280, 720)
         self.gop_length = 15
         self.hls_time = 2
+        self.rw_timeout = 5  # seconds, FFmpeg 讀取超時後退出並觸發重連
+        self.frame_pool_size = 3
         os.makedirs(self.video_clip_dir, exist_ok=True)
         self._load_configs()
         self.logger = logging.getLogger(__name__)
+        self.redis_client = redis.StrictRedis(connection_pool=redis_pool)
+        self.publish_window = 0.02  # seconds, 合併多路流的幀後一次 pipeline 寫入
+        self.publish_queue = queue.Queue()
+        self.frame_keys = {}
+        self.frame_compression_level = 1  # zstd 等級，1 為最快
+        self.zstd_local = threading.local()  # ZstdCompressor/ZstdDecompressor 不是線程安全的，每個線程各用一個
+        # 發布線程與事件循環在第一次 start_server 時才啟動，只用於查詢的臨時實例不會留下常駐線程
+        self.publisher_thread = None
+        # 所有流的捕獲協程都運行在同一個事件循環線程中
+        self.loop = None
+        self.loop_thread = None
+        self.start_lock = threading.Lock()
         self.stream_processes = {}
         self.stream_threads = {}
 
@@ -65,8 +92,7 @@ class VideoCapService:
         """
         try:
             for config in VideoCapConfig.objects.filter(is_active=True):
-                self.configs[config.rtmp_url] = config
-                self.running[config.rtmp_url] = False
+                self.streams[config.rtmp_url] = StreamState(rtmp_url=config.rtmp_url, config=config)
         except Exception as e:
             self.logger.error(f"Error loading configs: {str(e)}")
 
@@ -74,7 +100,8 @@ class VideoCapService:
         """
         啟動指定 RTMP URL 的視頻捕獲服務。
         """
-        if rtmp_url in self.running and self.running[rtmp_url]:
+        state = self.streams.get(rtmp_url)
+        if state is not None and state.running:
             return False, "Server already running"
 
         config, created = VideoCapConfig.objects.get_or_create(rtmp_url=rtmp_url)
@@ -82,14 +109,14 @@ class VideoCapService:
             config.name = f"Config_{config.id}"
             config.save()
 
-        self.configs[rtmp_url] = config
-        self.running[rtmp_url] = True
+        state = StreamState(rtmp_url=rtmp_url, config=config, running=True)
+        self.streams[rtmp_url] = state
         config.is_active = True
         config.save()
 
-        self._initialize_capture(rtmp_url)
-        self.capture_threads[rtmp_url] = threading.Thread(target=self._capture_loop, args=(rtmp_url,))
-        self.capture_threads[rtmp_url].start()
+        self._ensure_publisher()
+        self._ensure_loop()
+        state.task = asyncio.run_coroutine_threadsafe(self._capture_loop(state), self.loop)
 
         # 更新 CameraList 狀態
         CameraList.objects.filter(camera_url=rtmp_url).update(camera_status=True)
@@ -100,37 +127,32 @@ class VideoCapService:
         """
         停止指定 RTMP URL 的視頻捕獲服務。
         """
-        if rtmp_url not in self.running:
+        state = self.streams.get(rtmp_url)
+        if state is None:
             return False, "伺服器未找到"
 
-        self.running[rtmp_url] = False
+        config = state.config
+        state.running = False
 
-        # 等待捕獲線程結束
-        if rtmp_url in self.capture_threads:
-            try:
-                self.capture_threads[rtmp_url].join(timeout=10)
-                if self.capture_threads[rtmp_url].is_alive():
-                    self.logger.warning(f"線程 {rtmp_url} 未在指定時間內停止")
-            except Exception as e:
-                self.logger.error(f"停止線程 {rtmp_url} 時發生錯誤: {str(e)}")
-            finally:
-                del self.capture_threads[rtmp_url]
+        # 終止 FFmpeg 進程，讓等待中的讀取或重連退避立即返回；事件循環未啟動時沒有捕獲協程
+        if self.loop is not None:
+            asyncio.run_coroutine_threadsafe(self._stop_ffmpeg(state), self.loop)
+            self.loop.call_soon_threadsafe(state.stop_event.set)
 
-        # 檢查並釋放捕獲對象
-        if rtmp_url in self.caps and self.caps[rtmp_url] is not None:
+        # 等待捕獲協程結束
+        capture_task, state.task = state.task, None
+        if capture_task is not None:
             try:
-                self.caps[rtmp_url].release()
+                capture_task.result(timeout=10)
+            except FutureTimeoutError:
+                self.logger.warning(f"捕獲任務 {rtmp_url} 未在指定時間內停止")
             except Exception as e:
-                self.logger.error(f"釋放捕獲對象 {rtmp_url} 時發生錯誤: {str(e)}")
-            finally:
-                del self.caps[rtmp_url]
+                self.logger.error(f"停止捕獲任務 {rtmp_url} 時發生錯誤: {str(e)}")
 
         with transaction.atomic():
-            config = self.configs.get(rtmp_url)
-            if config:
-                config.is_active = False
-                config.save()
-                CurrentVideoClip.objects.filter(config=config).delete()
+            config.is_active = False
+            config.save()
+            CurrentVideoClip.objects.filter(config=config).delete()
 
         hls_output_dir = os.path.join(self.video_clip_dir, f"{rtmp_url.split('/')[-1]}_hls")
         if os.path.exists(hls_output_dir):
@@ -139,8 +161,9 @@ class VideoCapService:
             except Exception as e:
                 self.logger.error(f"刪除目錄 {hls_output_dir} 時發生錯誤: {str(e)}")
 
-        if rtmp_url in self.configs:
-            del self.configs[rtmp_url]
+        # 捕獲協程可能已經清理過；若已有新的一輪啟動，不能刪掉新的狀態
+        if self.streams.get(rtmp_url) is state:
+            del self.streams[rtmp_url]
 
         # 更新 CameraList 狀態
         CameraList.objects.filter(camera_url=rtmp_url).update(camera_status=False)
@@ -151,57 +174,43 @@ class VideoCapService:
         """
         檢查指定 RTMP URL 的服務運行狀態。
         """
-        is_running = self.running.get(rtmp_url, False)
+        state = self.streams.get(rtmp_url)
+        is_running = state is not None and state.running
         is_active = VideoCapConfig.objects.filter(rtmp_url=rtmp_url, is_active=True).exists()
         camera_status = CameraList.objects.filter(camera_url=rtmp_url, camera_status=True).exists()
         return is_running and is_active and camera_status
 
-    def _initialize_capture(self, rtmp_url):
+    def _build_ffmpeg_command(self, state, hls_output_dir):
         """
-        初始化視頻捕獲對象。
-        設置捕獲參數如幀率、分辨率等，並檢查捕獲對象是否成功打開。
+        構建 FFmpeg 命令。
+        單一輸入同時輸出兩路：HLS 片段，以及按 config.frame_interval 抽幀、縮放後的 BGR 原始幀（寫到 stdout）。
+        已有 config.stream_probe 時直接指定輸入格式並關閉探測；按探測結果構建的命令緩存在 state 中，重連時直接復用。
         """
-        if rtmp_url in self.caps and self.caps[rtmp_url] is not None:
-            self.caps[rtmp_url].release()
-
-        cap_source = 0 if rtmp_url == '0' else rtmp_url
-        try:
-            self.caps[rtmp_url] = cv2.VideoCapture(cap_source)
-            self.caps[rtmp_url].set(cv2.CAP_PROP_BUFFERSIZE, 1)
-            self.caps[rtmp_url].set(cv2.CAP_PROP_FPS, self.fps)
-            self.caps[rtmp_url].set(cv2.CAP_PROP_FRAME_WIDTH, self.resolution[0])
-            self.caps[rtmp_url].set(cv2.CAP_PROP_FRAME_HEIGHT, self.resolution[1])
-            if not self.caps[rtmp_url].isOpened():
-                raise Exception("Failed to open video capture")
-        except Exception as e:
-            self.logger.error(f"Error initializing capture for {rtmp_url}: {str(e)}")
-            self.caps[rtmp_url] = None
+        if state.ffmpeg_command is not None:
+            return state.ffmpeg_command
 
-    def _capture_loop(self, rtmp_url):
-        """
-        視頻捕獲的主循環。
-        持續從視頻流中讀取幀，處理重連邏輯，並更新視頻片段。
-        同時啟動 FFmpeg 進程來處理 HLS 輸出。
-        """
-        # 檢查 rtmp_url 是否在 self.configs 中
-        if rtmp_url not in self.configs:
-            self.logger.error(f"配置未找到：{rtmp_url}")
-            return
-
-        config = self.configs[rtmp_url]
-        reconnect_start_time = None
-        reconnect_attempts = 0
-        last_frame_time = time.time()
-        last_check_time = time.time()
-
-        hls_output_dir = os.path.join(self.video_clip_dir, f"{rtmp_url.split('/')[-1]}_hls")
-        os.makedirs(hls_output_dir, exist_ok=True)
+        config = state.config
+        width, height = self._get_frame_size(state)
         hls_output = os.path.join(hls_output_dir, 'index.m3u8')
 
-        ffmpeg_command = [
+        input_options = ()
+        if config.stream_probe:
+            input_options = (
+                '-probesize', '32',
+                '-analyzeduration', '0',
+                '-fflags', '+nobuffer',
+                '-f', config.stream_probe['format_name'].split(',')[0],
+            )
+
+        ffmpeg_command = (
             'ffmpeg',
             '-y',
-            '-i', rtmp_url,
+            '-loglevel', 'warning',  # Set log level to warning
+            '-rw_timeout', str(int(self.rw_timeout * 1000000)),
+            *input_options,
+            '-i', state.rtmp_url,
+            # 輸出 1：HLS
+            '-map', '0:v',
             '-c:v', 'libx264',
             '-preset', 'ultrafast',
             '-tune', 'zerolatency',
@@ -217,130 +226,481 @@ class VideoCapService:
             '-strftime', '1',
             '-strftime_mkdir', '1',
             '-hls_segment_filename', os.path.join(hls_output_dir, f'%Y%m%d%H%M_%s.ts'),
-            '-loglevel', 'warning',  # Set log level to warning
             '-err_detect', 'ignore_err',  # Ignore decoding errors
-            hls_output
-        ]
+            hls_output,
+            # 輸出 2：抽幀後的 BGR 原始幀
+            '-map', '0:v',
+            '-vf', f'fps={1 / config.frame_interval:g},scale={width}:{height}',
+            '-pix_fmt', 'bgr24',
+            '-f', 'rawvideo',
+            'pipe:1'
+        )
+        # 沒有探測結果時按默認分辨率構建的命令不緩存，探測成功後的下次啟動改用特化的命令
+        if config.stream_probe:
+            state.ffmpeg_command = ffmpeg_command
+        return ffmpeg_command
+
+    async def _start_ffmpeg(self, state, hls_output_dir):
+        """
+        啟動指定流的 FFmpeg 進程，並把其 stderr 交給事件循環轉發日誌，不另開線程。
+        原始幀寫入自建管道，返回 (FFmpeg 進程, 非阻塞的幀管道讀端)，失敗時返回 (None, None)。
+        """
+        frame_fd, frame_write_fd = os.pipe()
+        stderr_fd, stderr_write_fd = os.pipe()
+        try:
+            ffmpeg_process = await asyncio.create_subprocess_exec(
+                *self._build_ffmpeg_command(state, hls_output_dir),
+                stdout=frame_write_fd,
+                stderr=stderr_write_fd
+            )
+        except Exception as e:
+            self.logger.error(f"Error starting FFmpeg for {state.rtmp_url}: {str(e)}")
+            os.close(frame_fd)
+            os.close(stderr_fd)
+            return None, None
+        finally:
+            # 寫端已由 FFmpeg 繼承，關閉父進程的副本，FFmpeg 退出時讀端才會讀到 EOF
+            os.close(frame_write_fd)
+            os.close(stderr_write_fd)
+
+        os.set_blocking(stderr_fd, False)
+        self.loop.add_reader(stderr_fd, self._forward_stderr, state.rtmp_url, stderr_fd, bytearray())
+        width, height = self._get_frame_size(state)
+        self._enlarge_pipe(frame_fd, width * height * 3)
+        os.set_blocking(frame_fd, False)
+        state.process = ffmpeg_process
+        return ffmpeg_process, frame_fd
+
+    async def _stop_ffmpeg(self, state):
+        """
+        終止指定流的 FFmpeg 進程。
+        """
+        ffmpeg_process, state.process = state.process, None
+        if ffmpeg_process is None:
+            return
 
-        ffmpeg_process = None
         try:
-            ffmpeg_process = subprocess.Popen(ffmpeg_command, stderr=subprocess.PIPE, universal_newlines=True)
+            ffmpeg_process.terminate()
+            await asyncio.wait_for(ffmpeg_process.wait(), timeout=5)
+        except ProcessLookupError:
+            pass
+        except asyncio.TimeoutError:
+            ffmpeg_process.kill()
+        except Exception as e:
+            self.logger.error(f"終止 FFmpeg 進程 {state.rtmp_url} 時發生錯誤: {str(e)}")
 
-            def log_stderr(stderr):
-                for line in iter(stderr.readline, ''):
-                    if line.strip():
-                        self.logger.warning(f"FFmpeg: {line.strip()}")
+    def _forward_stderr(self, rtmp_url, fd, pending):
+        """
+        事件循環在 FFmpeg stderr 可讀時調用。
+        讀出當前可用的數據，按行記錄日誌並標註所屬的流，不完整的行留在 pending 中等待下次讀取。
+        讀到 EOF（FFmpeg 已退出）時取消註冊並關閉管道。
+        """
+        try:
+            data = os.read(fd, 65536)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            self.logger.error(f"Error reading FFmpeg stderr for {rtmp_url}: {str(e)}")
+            data = b''
+
+        if data:
+            pending += data
+            *lines, rest = pending.split(b'\n')
+            pending[:] = rest
+        else:
+            self.loop.remove_reader(fd)
+            os.close(fd)
+            lines = [pending]
+
+        for line in lines:
+            line = line.decode(errors='replace').strip()
+            if line:
+                self.logger.warning(f"FFmpeg {rtmp_url}: {line}")
+
+    def _enlarge_pipe(self, fd, frame_nbytes):
+        """
+        將管道緩衝區擴大到能容納一整幀（默認只有 64KB），
+        讓 FFmpeg 一次寫完一幀，避免數百次小寫入造成的調度來回切換。
+        超過 /proc/sys/fs/pipe-max-size 時退回到系統允許的最大值。
+        """
+        try:
+            fcntl.fcntl(fd, F_SETPIPE_SZ, frame_nbytes)
+        except OSError:
+            try:
+                with open('/proc/sys/fs/pipe-max-size') as f:
+                    fcntl.fcntl(fd, F_SETPIPE_SZ, int(f.read()))
+            except OSError as e:
+                self.logger.warning(f"Unable to enlarge FFmpeg pipe: {str(e)}")
 
-            threading.Thread(target=log_stderr, args=(ffmpeg_process.stderr,), daemon=True).start()
+    async def _read_frame(self, fd, frame):
+        """
+        從非阻塞的幀管道讀取一整幀 BGR 數據到預先分配的 frame 中。
+        管道暫無數據時把 fd 交給事件循環等待可讀，不佔用線程；讀到 EOF（FFmpeg 已退出）時返回 False。
+        """
+        view = memoryview(frame).cast('B')
+        filled = 0
+        while filled < len(view):
+            try:
+                n = os.readv(fd, [view[filled:]])
+            except BlockingIOError:
+                await self._wait_readable(fd)
+                continue
+            if not n:
+                return False
+            filled += n
+        return True
 
-            while self.running[rtmp_url]:
-                if rtmp_url in self.caps and self.caps[rtmp_url] is not None and self.caps[rtmp_url].isOpened():
-                    ret, frame = self.caps[rtmp_url].read()
-                    current_time = time.time()
+    async def _wait_readable(self, fd):
+        """
+        等待文件描述符可讀。
+        """
+        readable = self.loop.create_future()
+        self.loop.add_reader(fd, lambda: readable.done() or readable.set_result(None))
+        try:
+            await readable
+        finally:
+            self.loop.remove_reader(fd)
+
+    async def _capture_loop(self, state):
+        """
+        視頻捕獲的主協程。
+        只開一個 FFmpeg 進程拉流，同時產生 HLS 片段和抽幀後的原始幀，
+        持續讀取原始幀並交給發布線程，處理重連邏輯，並更新視頻片段。
+        所有流的協程共用一個事件循環線程；數據庫操作放到線程中執行。
+        """
+        rtmp_url = state.rtmp_url
+        state.reconnect_start_time = None
+        state.reconnect_attempts = 0
+        state.last_check_time = time.time()
+
+        hls_output_dir = os.path.join(self.video_clip_dir, f"{rtmp_url.split('/')[-1]}_hls")
+        os.makedirs(hls_output_dir, exist_ok=True)
 
-                    if ret:
-                        last_frame_time = current_time
-                        reconnect_start_time = None
-                        reconnect_attempts = 0
-
-                        if current_time - last_check_time >= self.check_interval:
-                            self._check_and_update_video_clip(rtmp_url, hls_output_dir)
-                            last_check_time = current_time
-
-                    elif current_time - last_frame_time > 1:
-                        if reconnect_start_time is None:
-                            reconnect_start_time = current_time
-                            reconnect_attempts += 1
-                        self._reconnect(rtmp_url)
-                else:
-                    if reconnect_start_time is None:
-                        reconnect_start_time = time.time()
-                        reconnect_attempts += 1
-                    self._reconnect(rtmp_url)
-
-                if reconnect_start_time is not None:
-                    elapsed_time = time.time() - reconnect_start_time
-                    if elapsed_time > self.reconnect_timeout or reconnect_attempts > self.max_reconnect_attempts:
-                        self._set_inactive(rtmp_url)
+        frame_fd = None
+        try:
+            await self._ensure_stream_probe(state)
+            ffmpeg_process, frame_fd = await self._start_ffmpeg(state, hls_output_dir)
+
+            while state.running:
+                frame_pool, discard_frame = self._get_frame_buffers(state)
+                frame_read = False
+                while ffmpeg_process is not None and state.running:
+                    buffer_id, frame = frame_pool.reserve_for_producer()
+                    if not await self._read_frame(frame_fd, frame if frame is not None else discard_frame):
+                        if buffer_id is not None:
+                            frame_pool.relinquish(buffer_id)
                         break
 
+                    if buffer_id is not None:
+                        self.publish_queue.put((rtmp_url, frame_pool, buffer_id))
+                    frame_read = True
+                    state.reconnect_start_time = None
+                    state.reconnect_attempts = 0
+
+                    current_time = time.time()
+                    if current_time - state.last_check_time >= self.check_interval:
+                        await asyncio.to_thread(self._check_and_update_video_clip, state, hls_output_dir)
+                        state.last_check_time = current_time
+
+                if not state.running:
+                    break
+
+                # 按探測結果特化的命令一幀都沒有產生時，探測結果可能已過期（攝像頭更換了格式或分辨率）
+                if not frame_read and state.config.stream_probe:
+                    await self._invalidate_stream_probe(state)
+
+                if state.reconnect_start_time is None:
+                    state.reconnect_start_time = time.time()
+                state.reconnect_attempts += 1
+                if state.reconnect_attempts > self.max_reconnect_attempts or time.time() - state.reconnect_start_time > self.reconnect_timeout:
+                    await asyncio.to_thread(self._set_inactive, state)
+                    break
+
+                if frame_fd is not None:
+                    os.close(frame_fd)
+                    frame_fd = None
+                ffmpeg_process, frame_fd = await self._reconnect(state, hls_output_dir)
+
         except Exception as e:
             self.logger.error(f"捕獲循環中發生錯誤 {rtmp_url}: {str(e)}")
         finally:
-            if ffmpeg_process:
-                ffmpeg_process.terminate()
-                ffmpeg_process.wait()
+            await self._stop_ffmpeg(state)
+            if frame_fd is not None:
+                os.close(frame_fd)
 
         # 在循環結束後清理資源
-        self._cleanup_resources(rtmp_url)
+        await asyncio.to_thread(self._cleanup_resources, state)
+
+    async def _ensure_stream_probe(self, state):
+        """
+        尚無 config.stream_probe 時探測視頻流並保存，之後的啟動直接使用保存的結果。
+        """
+        config = state.config
+        if not config.stream_probe:
+            config.stream_probe = await self._probe_stream(state.rtmp_url)
+            if config.stream_probe:
+                # 緩存的命令與幀大小都來自舊的（或默認的）分辨率，必須按新的探測結果重新構建
+                state.ffmpeg_command = None
+                await asyncio.to_thread(config.save, update_fields=['stream_probe'])
+
+    async def _invalidate_stream_probe(self, state):
+        """
+        清除 config.stream_probe 與據此構建的 FFmpeg 命令，下次啟動前重新探測。
+        """
+        self.logger.warning(f"No frames from {state.rtmp_url} with the probed FFmpeg options, probing again")
+        state.config.stream_probe = None
+        state.ffmpeg_command = None
+        await asyncio.to_thread(state.config.save, update_fields=['stream_probe'])
+
+    def _get_frame_buffers(self, state):
+        """
+        返回與當前幀大小一致的幀池，以及幀池用盡時讀入丟棄的緩衝區，保證 FFmpeg 管道不被堵塞。
+        重新探測後幀大小改變時重新分配幀池，發布中的舊緩衝區仍歸還到舊幀池。
+        """
+        width, height = self._get_frame_size(state)
+        if state.frame_pool is None or state.frame_pool.shape != (height, width, 3):
+            state.frame_pool = FrameBufferPool((height, width, 3), self.frame_pool_size)
+        return state.frame_pool, np.empty((height, width, 3), dtype=np.uint8)
 
-    def _get_frame_size(self, rtmp_url):
+    def _get_frame_size(self, state):
         """
-        獲取指定 RTMP URL 的幀大小（分辨率）。
+        獲取指定流的幀大小（分辨率）。
+        返回 config.stream_probe 中的源分辨率，尚未探測或探測失敗時返回默認分辨率。
         """
+        stream_probe = state.config.stream_probe
+        if stream_probe:
+            return stream_probe['width'], stream_probe['height']
         return self.resolution
 
-    def _reconnect(self, rtmp_url):
+    async def _probe_stream(self, rtmp_url):
+        """
+        用 ffprobe 查詢視頻流的容器格式、編碼、寬高與像素格式，不讀取、不解碼任何幀。
+        結果保存到 VideoCapConfig.stream_probe，之後啟動時不再探測。查詢失敗或寬高為 0 時返回 None。
+        """
+        command = [
+            'ffprobe',
+            '-v', 'quiet',
+            '-rw_timeout', str(int(self.rw_timeout * 1000000)),
+            '-select_streams', 'v:0',
+            '-show_entries', 'stream=codec_name,width,height,pix_fmt:format=format_name',
+            '-print_format', 'json',
+            rtmp_url
+        ]
+        try:
+            process = await asyncio.create_subprocess_exec(*command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            stdout, _ = await asyncio.wait_for(process.communicate(), timeout=self.rw_timeout)
+            result = json.loads(stdout)
+            stream = result['streams'][0]
+            stream_probe = {
+                'format_name': result['format']['format_name'],
+                'codec_name': stream.get('codec_name'),
+                'width': int(stream['width']),
+                'height': int(stream['height']),
+                'pix_fmt': stream.get('pix_fmt'),
+            }
+        except asyncio.TimeoutError:
+            process.kill()
+            self.logger.warning(f"Probing stream timed out for {rtmp_url}")
+            return None
+        except Exception as e:
+            self.logger.warning(f"Error probing stream for {rtmp_url}: {str(e)}")
+            return None
+        return stream_probe if stream_probe['width'] and stream_probe['height'] else None
+
+    async def _reconnect(self, state, hls_output_dir):
         """
-        嘗試重新連接視頻捕獲對象。
-        釋放當前捕獲對象並重新初始化。
+        嘗試重新連接視頻流。
+        終止當前 FFmpeg 進程，按 state.reconnect_attempts 指數退避等待後重新啟動；探測結果已被清除時先重新探測。
+        等待期間事件循環繼續處理其他流；流被停止時立即返回 (None, None)。
         """
-        if rtmp_url in self.caps and self.caps[rtmp_url] is not None:
-            self.caps[rtmp_url].release()
-        self.caps[rtmp_url] = None
-        time.sleep(1)
-        self._initialize_capture(rtmp_url)
-        return self.caps[rtmp_url] is not None and self.caps[rtmp_url].isOpened()
+        await self._stop_ffmpeg(state)
+        # reconnect_attempts 不超過 max_reconnect_attempts，等待最長為 2 ** (max_reconnect_attempts - 1) 秒
+        delay = 2 ** (state.reconnect_attempts - 1)
+        try:
+            await asyncio.wait_for(state.stop_event.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+        if not state.running:
+            return None, None
+        await self._ensure_stream_probe(state)
+        return await self._start_ffmpeg(state, hls_output_dir)
 
-    def _set_inactive(self, rtmp_url):
+    def _set_inactive(self, state):
         """
-        將指定的 RTMP URL 配置設置為非活動狀態。
+        將指定流的配置設置為非活動狀態。
         清理相關資源和數據庫記錄。
         """
         with transaction.atomic():
-            config = self.configs[rtmp_url]
+            config = state.config
             config.is_active = False
             config.save()
 
             CurrentVideoClip.objects.filter(config=config).delete()
 
-        self.running[rtmp_url] = False
-        if rtmp_url in self.caps and self.caps[rtmp_url] is not None:
-            self.caps[rtmp_url].release()
-        self.caps[rtmp_url] = None
-
-        if rtmp_url in self.capture_threads:
-            del self.capture_threads[rtmp_url]
+        state.running = False
+        state.task = None
 
-        hls_output_dir = os.path.join(self.video_clip_dir, f"{rtmp_url.split('/')[-1]}_hls")
+        hls_output_dir = os.path.join(self.video_clip_dir, f"{state.rtmp_url.split('/')[-1]}_hls")
         if os.path.exists(hls_output_dir):
             shutil.rmtree(hls_output_dir)
 
     async def update_frame(self, rtmp_url, frame):
         """
         異步更新當前幀。
-        將幀編碼為 JPEG 並存儲在 Redis 中。
+        將原始 BGR 幀及其形狀信息存儲在 Redis 中。
+        """
+        await asyncio.to_thread(self._publish_frame, rtmp_url, frame)
+
+    def _publish_frame(self, rtmp_url, frame):
+        """
+        將原始 BGR 幀存儲在 Redis 中，不做 JPEG 編碼。
         """
         if frame is None:
             return
 
-        _, buffer = cv2.imencode('.jpg', frame)
-        frame_bytes = buffer.tobytes()
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            self._queue_frame(pipe, rtmp_url, frame)
+            pipe.execute()
+        except Exception as e:
+            self.logger.error(f"Error publishing frame for {rtmp_url}: {str(e)}")
+
+    def _get_frame_keys(self, rtmp_url):
+        """
+        獲取指定 RTMP URL 的 `:raw` 鍵、`:meta` 鍵與新幀頻道名。
+        每路流只格式化、編碼一次，之後每幀直接使用緩存的 bytes。
+        """
+        frame_keys = self.frame_keys.get(rtmp_url)
+        if frame_keys is None:
+            key = f"video_cap_service:current_image:{rtmp_url}"
+            frame_keys = (
+                f"{key}:raw".encode(),
+                f"{key}:meta".encode(),
+                f"video_cap_service:new_frame:{rtmp_url}".encode()
+            )
+            self.frame_keys[rtmp_url] = frame_keys
+        return frame_keys
+
+    def _queue_frame(self, pipe, rtmp_url, frame):
+        """
+        把一幀的寫入命令加入 pipeline。
+        幀數據寫入 `:raw` 鍵，形狀、dtype 與時間戳寫入 `:meta` 鍵，
+        並在 `video_cap_service:new_frame:{rtmp_url}` 頻道發布時間戳，消費者無需輪詢。
+        幀數據經 _compress_frame 處理，未壓縮時以 memoryview 傳入，pipeline 執行前不能改動 frame。
+        """
+        raw_key, meta_key, channel = self._get_frame_keys(rtmp_url)
+        height, width, channels = frame.shape
+        timestamp = time.time()
+        payload, codec = self._compress_frame(frame)
+        meta = json.dumps({'h': height, 'w': width, 'c': channels, 'dtype': str(frame.dtype), 'codec': codec, 'ts': timestamp})
+        pipe.mset({raw_key: payload, meta_key: meta})
+        pipe.publish(channel, timestamp)
+
+    def _compress_frame(self, frame):
+        """
+        以 zstd 壓縮原始 BGR 幀，減少寫入 Redis 的字節數，返回 (數據, codec)。
+        未安裝 zstandard 時返回未壓縮的 memoryview，codec 為 'raw'。
+        """
+        if zstandard is None:
+            return memoryview(frame).cast('B'), 'raw'
+
+        compressor = getattr(self.zstd_local, 'compressor', None)
+        if compressor is None:
+            compressor = zstandard.ZstdCompressor(level=self.frame_compression_level)
+            self.zstd_local.compressor = compressor
+        return compressor.compress(frame), 'zstd'
+
+    def _ensure_publisher(self):
+        """
+        按需啟動幀發布線程，每個實例只啟動一次。
+        """
+        with self.start_lock:
+            if self.publisher_thread is None:
+                self.publisher_thread = threading.Thread(target=self._publish_loop, name='VideoCapServicePublisher', daemon=True)
+                self.publisher_thread.start()
+
+    def _ensure_loop(self):
+        """
+        按需創建事件循環並在專用線程中運行，每個實例只啟動一次。
+        """
+        with self.start_lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                self.loop_thread = threading.Thread(target=self.loop.run_forever, name='VideoCapServiceLoop', daemon=True)
+                self.loop_thread.start()
+
+    def _publish_loop(self):
+        """
+        幀發布線程。
+        收集所有流在 publish_window 內的幀，通過一個非事務 pipeline 一次寫入 Redis，
+        寫入完成後將緩衝區歸還給各自的幀池。
+        """
+        while True:
+            batch = [self.publish_queue.get()]
+            deadline = time.time() + self.publish_window
+            while True:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.publish_queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
 
-        await asyncio.to_thread(self.redis_client.set, f"video_cap_service:current_image:{rtmp_url}", frame_bytes)
+            try:
+                pipe = self.redis_client.pipeline(transaction=False)
+                for rtmp_url, frame_pool, buffer_id in batch:
+                    self._queue_frame(pipe, rtmp_url, frame_pool.buffers[buffer_id])
+                pipe.execute()
+            except Exception as e:
+                self.logger.error(f"Error publishing frames: {str(e)}")
+            finally:
+                for _, frame_pool, buffer_id in batch:
+                    frame_pool.relinquish(buffer_id)
 
-    def _check_and_update_video_clip(self, rtmp_url, hls_output_dir):
+    def get_current_frame(self, rtmp_url):
+        """
+        從 Redis 讀取指定 RTMP URL 的當前幀。
+        zstd 解壓（每個線程復用一個解壓器）後直接用 np.frombuffer 還原為 (h, w, c) 陣列，無需圖像解碼；沒有幀時返回 None。
+        """
+        raw_key, meta_key, _ = self._get_frame_keys(rtmp_url)
+        try:
+            raw, meta = self.redis_client.mget(raw_key, meta_key)
+        except Exception as e:
+            self.logger.error(f"Error reading frame for {rtmp_url}: {str(e)}")
+            return None
+
+        if raw is None or meta is None:
+            return None
+
+        meta = json.loads(meta)
+        if meta.get('codec') == 'zstd':
+            if zstandard is None:
+                self.logger.error(f"Frame for {rtmp_url} is zstd-compressed but zstandard is not installed")
+                return None
+            decompressor = getattr(self.zstd_local, 'decompressor', None)
+            if decompressor is None:
+                decompressor = zstandard.ZstdDecompressor()
+                self.zstd_local.decompressor = decompressor
+            raw = decompressor.decompress(raw)
+        return np.frombuffer(raw, dtype=meta['dtype']).reshape(meta['h'], meta['w'], meta['c'])
+
+    def _check_and_update_video_clip(self, state, hls_output_dir):
         """
         檢查並更新視頻片段。
         查找最新的 TS 文件並在數據庫中創建相應的 CurrentVideoClip 記錄。
+        最新文件與上次登記的相同時直接返回，不訪問數據庫。
         """
-        config = self.configs[rtmp_url]
+        rtmp_url = state.rtmp_url
+        config = state.config
 
         try:
             ts_files = [f for f in os.listdir(hls_output_dir) if f.endswith('.ts')]
             if ts_files:
                 latest_ts_file = max(ts_files, key=lambda f: os.path.getmtime(os.path.join(hls_output_dir, f)))
                 ts_file_path = os.path.join(hls_output_dir, latest_ts_file)
+                if state.last_clip_path == ts_file_path:
+                    return
 
                 existing_clip = CurrentVideoClip.objects.filter(config=config, clip_path=ts_file_path).first()
                 if not existing_clip:
@@ -356,6 +716,8 @@ class VideoCapService:
                                 end_time=ts_file_timestamp + timedelta(seconds=self.video_clip_duration),
                                 duration=self.video_clip_duration
                             )
+                        self.redis_client.publish(f"video_cap_service:new_clip:{rtmp_url}", ts_file_path)
+                state.last_clip_path = ts_file_path
         except Exception as e:
             self.logger.error(f"Error checking and updating video clip for {rtmp_url}: {str(e)}")
 
@@ -364,23 +726,26 @@ class VideoCapService:
         析構函數。
         確保所有運行中的服務在對象被銷毀時停止。
         """
-        for rtmp_url in list(self.running.keys()):
-            if self.running[rtmp_url]:
+        for rtmp_url, state in list(self.streams.items()):
+            if state.running:
                 self.stop_server(rtmp_url)
         for rtmp_url in list(self.stream_processes.keys()):
             self._stop_stream(rtmp_url)
 
     def list_running_threads(self):
         """
-        列出所有正在運行的捕獲線程的信息。
+        列出所有正在運行的捕獲任務的信息。
+        所有捕獲協程共用事件循環線程，線程信息即該線程的信息。
         """
         running_threads = []
-        for rtmp_url, thread in self.capture_threads.items():
+        for rtmp_url, state in self.streams.items():
+            if state.task is None:
+                continue
             running_threads.append({
                 'rtmp_url': rtmp_url,
-                'thread_id': thread.ident,
-                'thread_name': thread.name,
-                'is_alive': thread.is_alive()
+                'thread_id': self.loop_thread.ident,
+                'thread_name': self.loop_thread.name,
+                'is_alive': not state.task.done()
             })
         return running_threads
 
@@ -403,8 +768,8 @@ class VideoCapService:
         停止所有正在運行的視頻捕獲服務。
         """
         stopped_count = 0
-        for rtmp_url in list(self.running.keys()):
-            if self.running[rtmp_url]:
+        for rtmp_url, state in list(self.streams.items()):
+            if state.running:
                 success, _ = self.stop_server(rtmp_url)
                 if success:
                     stopped_count += 1
@@ -434,19 +799,16 @@ class VideoCapService:
             print(f"FFmpeg 檢測錯誤：{e}")
             return False
 
-    def _cleanup_resources(self, rtmp_url):
+    def _cleanup_resources(self, state):
         """
         清理與特定 RTMP URL 相關的資源
         """
-        if rtmp_url in self.caps and self.caps[rtmp_url] is not None:
-            self.caps[rtmp_url].release()
-            del self.caps[rtmp_url]
-
-        if rtmp_url in self.running:
-            del self.running[rtmp_url]
+        rtmp_url = state.rtmp_url
+        self.frame_keys.pop(rtmp_url, None)
 
-        if rtmp_url in self.configs:
-            del self.configs[rtmp_url]
+        # 只刪除本輪捕獲自己的狀態，不影響之後重新啟動的同一路流
+        if self.streams.get(rtmp_url) is state:
+            del self.streams[rtmp_url]
 
         # 更新 CameraList 狀態
         CameraList.objects.filter(camera_url=rtmp_url).update(camera_status=False)
@@ -1,8 +1,69 @@
+import queue
+import threading
+import time
+import torch
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 from ..utils.detection_utils import load_detection_model
 
 class DetectionService:
     def __init__(self):
         self.detection_model = load_detection_model("models/360_1280_person_yolov8m/1/model/best.pt")
+        self.half = torch.cuda.is_available()  # GPU 上以 FP16 推理
+        self.max_batch_size = 8
+        self.batch_window = 0.01  # seconds, 等待其他流的請求以合併成一個批次
+        self.detect_timeout = 30  # seconds, 推理線程異常時調用方最多等待的時間
+        self.requests = queue.Queue()
+        threading.Thread(target=self._inference_loop, daemon=True).start()
 
-    def detect_objects(self, frame):
-        return self.detection_model(frame, classes=[0], verbose=False, imgsz=1280)
+    def detect_objects(self, frames):
+        """
+        檢測一組幀，返回與 frames 一一對應的結果列表。
+        請求交給推理線程與其他流的請求合併為一次批量前向推理，調用方阻塞直到結果返回，
+        超過 detect_timeout 仍未返回時取消請求並拋出 TimeoutError，尚未開始推理的請求不會再佔用模型。
+        """
+        future = Future()
+        self.requests.put((list(frames), future))
+        try:
+            return future.result(timeout=self.detect_timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise
+
+    def _inference_loop(self):
+        """
+        推理線程。
+        收集 batch_window 內所有流的檢測請求，合併為一個批次送入模型，再把結果分發回各請求。
+        模型只在這個線程中調用，多個繪圖線程不會並發使用同一個模型。
+        調用方已超時取消的請求直接丟棄，不送入模型。
+        任何異常都會設置到本批次尚未完成的請求上，線程本身不會退出。
+        """
+        while True:
+            batch = [self.requests.get()]
+            try:
+                frame_count = len(batch[0][0])
+                deadline = time.time() + self.batch_window
+                while frame_count < self.max_batch_size:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        request = self.requests.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    batch.append(request)
+                    frame_count += len(request[0])
+
+                batch = [(request_frames, future) for request_frames, future in batch if future.set_running_or_notify_cancel()]
+                if not batch:
+                    continue
+                frames = [frame for request_frames, _ in batch for frame in request_frames]
+                results = self.detection_model(frames, classes=[0], verbose=False, imgsz=1280, half=self.half)
+
+                offset = 0
+                for request_frames, future in batch:
+                    future.set_result(results[offset:offset + len(request_frames)])
+                    offset += len(request_frames)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
@@ -6,9 +6,11 @@ from .drawing_service import DrawingService
 from .ffmpeg_service import FFmpegService
 from ..models import CameraDrawingStatus
 from ...videoCap_server.models import CurrentVideoClip
+from ...BaseService.redis_pool import redis_pool
 from django.db import transaction
 import time
 import cv2
+import redis
 
 class VideoProcessingService:
     def __init__(self):
@@ -64,6 +66,8 @@ class VideoProcessingService:
             return False, f"Error stopping draw service: {str(e)}"
 
     def _draw_loop(self, rtmp_url):
+        # 沒有新片段時阻塞等待 VideoCapService 的新片段通知，Redis 不可用時退回按 fps 輪詢數據庫
+        pubsub = None
         try:
             config = self.config_service.get_config(rtmp_url)
             max_retries = 5
@@ -71,6 +75,9 @@ class VideoProcessingService:
 
             for attempt in range(max_retries):
                 try:
+                    if pubsub is None:
+                        pubsub = self._subscribe_new_clip(rtmp_url)
+
                     if not self.ffmpeg_service.is_ffmpeg_running(rtmp_url):
                         self.ffmpeg_service.start_ffmpeg_process(rtmp_url, config['output_url'])
 
@@ -92,7 +99,7 @@ class VideoProcessingService:
                                         sleep_time = max(0, ((1 - time_diff) / config['fps']))
                                         time.sleep(sleep_time)
                         else:
-                            time.sleep(1 / config['fps'])
+                            self._wait_for_new_clip(pubsub, config['fps'])
 
                     break  # If we get here, the loop ran successfully
                 except Exception as e:
@@ -103,8 +110,28 @@ class VideoProcessingService:
         except Exception as e:
             pass
         finally:
+            if pubsub is not None:
+                pubsub.close()
             self.ffmpeg_service.stop_ffmpeg_process(rtmp_url)
 
+    def _subscribe_new_clip(self, rtmp_url):
+        pubsub = redis.StrictRedis(connection_pool=redis_pool).pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.subscribe(f"video_cap_service:new_clip:{rtmp_url}")
+        except redis.ConnectionError:
+            pubsub.close()
+            return None
+        return pubsub
+
+    def _wait_for_new_clip(self, pubsub, fps):
+        if pubsub is not None:
+            try:
+                pubsub.get_message(timeout=1.0)
+                return
+            except redis.ConnectionError:
+                pass
+        time.sleep(1 / fps)
+
     def _process_video_clip(self, rtmp_url):
         try:
             with transaction.atomic():
@@ -147,10 +174,9 @@ class VideoProcessingService:
                 if len(frames) > 0:
                     first_frame = frames[0]
                     last_frame = frames[-1]
-                    first_result = self.detection_service.detect_objects(first_frame)
-                    last_result = self.detection_service.detect_objects(last_frame)
+                    first_result, last_result = self.detection_service.detect_objects([first_frame, last_frame])
 
-                    frames = self.drawing_service.draw_all_results(frames, first_result, last_result)
+                    frames = self.drawing_service.draw_all_results(frames, [first_result], [last_result])
 
                     current_video_clip.delete()
                     os.remove(clip_path)
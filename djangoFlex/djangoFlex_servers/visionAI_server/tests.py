@@ -1,3 +1,92 @@
-from django.test import TestCase
+import random
+from django.test import SimpleTestCase
+from .utils.math_utils import calculate_distance, interpolate_detections, match_detections
 
-# Create your tests here.
+def reference_match_detections(first_detections, last_detections):
+    """
+    原來逐對比較的列表實現，作為向量化版本的對照。
+    """
+    if not first_detections or not last_detections:
+        return [], []
+
+    distances = [[calculate_distance(first, last) for last in last_detections] for first in first_detections]
+    matched_pairs = []
+    unmatched_first = list(range(len(first_detections)))
+    unmatched_last = list(range(len(last_detections)))
+
+    while unmatched_first and unmatched_last:
+        i, j = min(((i, j) for i in unmatched_first for j in unmatched_last), key=lambda x: distances[x[0]][x[1]])
+        matched_pairs.append((i, j))
+        unmatched_first.remove(i)
+        unmatched_last.remove(j)
+
+    return matched_pairs, unmatched_last
+
+def reference_interpolate_detections(first_detections, last_detections, interval):
+    """
+    原來逐框逐幀計算的列表實現，作為向量化版本的對照。
+    """
+    matched_pairs, unmatched_last = reference_match_detections(first_detections, last_detections)
+
+    interpolated = [[] for _ in range(interval)]
+
+    for i, j in matched_pairs:
+        first = first_detections[i]
+        last = last_detections[j]
+        for k in range(interval):
+            weight = (k + 1) / (interval + 1)
+            x1 = int(first[0] * (1 - weight) + last[0] * weight)
+            y1 = int(first[1] * (1 - weight) + last[1] * weight)
+            x2 = int(first[2] * (1 - weight) + last[2] * weight)
+            y2 = int(first[3] * (1 - weight) + last[3] * weight)
+            interpolated[k].append((x1, y1, x2, y2))
+
+    for j in unmatched_last:
+        for k in range(interval):
+            interpolated[k].append(last_detections[j])
+
+    return interpolated
+
+def random_boxes(rng, count, grid):
+    """
+    在 grid 大小的座標範圍內生成 count 個 (x1, y1, x2, y2) 邊界框；grid 越小，距離相等的情況越多。
+    """
+    boxes = []
+    for _ in range(count):
+        x1, y1 = rng.randrange(grid), rng.randrange(grid)
+        boxes.append((x1, y1, x1 + rng.randrange(1, grid), y1 + rng.randrange(1, grid)))
+    return boxes
+
+class MathUtilsTest(SimpleTestCase):
+    def test_match_detections_matches_reference(self):
+        rng = random.Random(0)
+        for grid in (4, 1280):
+            for _ in range(200):
+                first = random_boxes(rng, rng.randrange(0, 8), grid)
+                last = random_boxes(rng, rng.randrange(0, 8), grid)
+                self.assertEqual(match_detections(first, last), reference_match_detections(first, last))
+
+    def test_match_detections_breaks_ties_in_row_major_order(self):
+        box = (10, 10, 20, 20)
+        first = [box, box, (0, 0, 4, 4)]
+        last = [box, box]
+        self.assertEqual(match_detections(first, last), reference_match_detections(first, last))
+        self.assertEqual(match_detections(first, last), ([(0, 0), (1, 1)], []))
+
+    def test_interpolate_detections_matches_reference(self):
+        rng = random.Random(1)
+        for grid in (4, 1280):
+            for _ in range(200):
+                first = random_boxes(rng, rng.randrange(0, 8), grid)
+                last = random_boxes(rng, rng.randrange(0, 8), grid)
+                interval = rng.randrange(0, 10)
+                self.assertEqual(
+                    interpolate_detections(first, last, interval),
+                    reference_interpolate_detections(first, last, interval)
+                )
+
+    def test_interpolate_detections_with_zero_interval(self):
+        first = [(0, 0, 10, 10)]
+        last = [(5, 5, 15, 15), (100, 100, 110, 110)]
+        self.assertEqual(interpolate_detections(first, last, 0), [])
+        self.assertEqual(interpolate_detections(first, last, 0), reference_interpolate_detections(first, last, 0))
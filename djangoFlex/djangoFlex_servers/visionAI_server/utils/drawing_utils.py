@@ -63,10 +63,9 @@ def draw_all_results(frames, first_result, last_result):
 
     num_frames = len(frames)
 
-    first_detections = [(int(box.xyxy[0][0]), int(box.xyxy[0][1]), int(box.xyxy[0][2]), int(box.xyxy[0][3]))
-                        for r in first_result for box in r.boxes]
-    last_detections = [(int(box.xyxy[0][0]), int(box.xyxy[0][1]), int(box.xyxy[0][2]), int(box.xyxy[0][3]))
-                       for r in last_result for box in r.boxes]
+    # 每個結果只做一次 xyxy 張量到 Python 的轉換，而不是每個坐標單獨取值
+    first_detections = [tuple(box) for r in first_result for box in r.boxes.xyxy.int().tolist()]
+    last_detections = [tuple(box) for r in last_result for box in r.boxes.xyxy.int().tolist()]
 
     interpolated_detections = interpolate_detections(first_detections, last_detections, num_frames - 2)
 
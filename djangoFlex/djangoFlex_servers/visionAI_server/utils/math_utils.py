@@ -54,16 +54,14 @@ def interpolate_detections(first_detections, last_detections, interval):
 
     interpolated = [[] for _ in range(interval)]
 
-    for i, j in matched_pairs:
-        first = first_detections[i]
-        last = last_detections[j]
-        for k in range(interval):
-            weight = (k + 1) / (interval + 1)
-            x1 = int(first[0] * (1 - weight) + last[0] * weight)
-            y1 = int(first[1] * (1 - weight) + last[1] * weight)
-            x2 = int(first[2] * (1 - weight) + last[2] * weight)
-            y2 = int(first[3] * (1 - weight) + last[3] * weight)
-            interpolated[k].append((x1, y1, x2, y2))
+    if matched_pairs and interval > 0:
+        # 以 (M, 4) 坐標陣列一次計算所有匹配對在所有插值幀上的邊界框
+        first_indices, last_indices = zip(*matched_pairs)
+        first = np.asarray(first_detections)[list(first_indices)]
+        last = np.asarray(last_detections)[list(last_indices)]
+        weights = (np.arange(1, interval + 1) / (interval + 1))[:, None, None]
+        boxes = (first * (1 - weights) + last * weights).astype(int)
+        interpolated = [[tuple(box) for box in frame_boxes] for frame_boxes in boxes.tolist()]
 
     for j in unmatched_last:
         for k in range(interval):
@@ -85,16 +83,22 @@ def match_detections(first_detections, last_detections):
     if not first_detections or not last_detections:
         return [], []
 
-    distances = [[calculate_distance(first, last) for last in last_detections] for first in first_detections]
+    first = np.asarray(first_detections, dtype=float)
+    last = np.asarray(last_detections, dtype=float)
+    first_centers = (first[:, :2] + first[:, 2:]) / 2
+    last_centers = (last[:, :2] + last[:, 2:]) / 2
+    distances = np.linalg.norm(first_centers[:, None, :] - last_centers[None, :, :], axis=2)
+
+    # 貪婪匹配：每次取剩餘距離最小的一對，已匹配的行列設為 inf
     matched_pairs = []
-    unmatched_first = list(range(len(first_detections)))
-    unmatched_last = list(range(len(last_detections)))
-
-    while unmatched_first and unmatched_last:
-        i, j = min(((i, j) for i in unmatched_first for j in unmatched_last), key=lambda x: distances[x[0]][x[1]])
-        matched_pairs.append((i, j))
-        unmatched_first.remove(i)
-        unmatched_last.remove(j)
+    for _ in range(min(len(first_detections), len(last_detections))):
+        i, j = np.unravel_index(np.argmin(distances), distances.shape)
+        matched_pairs.append((int(i), int(j)))
+        distances[i, :] = np.inf
+        distances[:, j] = np.inf
+
+    matched_last = {j for _, j in matched_pairs}
+    unmatched_last = [j for j in range(len(last_detections)) if j not in matched_last]
 
     return matched_pairs, unmatched_last
 